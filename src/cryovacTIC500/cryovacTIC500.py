@@ -1,8 +1,13 @@
+import select
 import socket
+import threading
+import time
+from collections import deque
+from concurrent import futures
 from enum import IntEnum
-from functools import partial
+from typing import Any, Callable, Optional
 
-from tango import DevState
+from tango import AttrQuality, DevState
 from tango.server import AttrWriteType, Device, attribute, command, device_property
 
 
@@ -33,31 +38,98 @@ class PIDMode(IntEnum):
     # Follow = 2
 
 
+_NL = b"\n"
+_WRITE_SUFFIX = b")\n"
+RECV_SIZE = 256  # replies are short single lines
+REPLY_TIMEOUT = 1.0
+POLL_MIN = 0.001
+POLL_MAX = 0.05
+RECONNECT_INTERVAL = 10.0  # seconds between attempts while the device is offline
+STALE_SCANS = 3  # scan periods after which a cached value is reported INVALID
+
+VERBOSE_ON = b"system.com.verbose=high"
+OUTPUT_ENABLE = b"OutputEnable"  # echo of outputEnable replies
+
 RO = AttrWriteType.READ
 RW = AttrWriteType.READ_WRITE
 
-# by default, access is READ_WRITE
+# by default, access is READ_WRITE and values are re-read from the device on
+# every scan (ttl: minimum age in seconds before a value is read again)
 OUTPUT_CHANNEL_ATTRIBUTES = dict(
-    power=dict(cmd="Value", dtype=float),
-    setpoint=dict(cmd="pid.Setpoint", dtype=float),
-    ramp=dict(cmd="pid.Ramp", dtype=float),
+    power=dict(cmd="Value", dtype=float, ttl=0.5),
+    setpoint=dict(cmd="pid.Setpoint", dtype=float, ttl=1.0),
+    ramp=dict(cmd="pid.Ramp", dtype=float, ttl=5.0),
     ramp_setpoint=dict(cmd="pid.Ramp T", dtype=float, access=RO),
-    PID_input=dict(cmd="pid.Input", dtype=str),
-    PID_mode=dict(cmd="pid.Mode", dtype=PIDMode),
-    P=dict(cmd="pid.P", dtype=float),
-    I=dict(cmd="pid.I", dtype=float),
-    D=dict(cmd="pid.D", dtype=float),
-    tune_mode=dict(cmd="tune.Mode", dtype=TuneMode),
-    tune_type=dict(cmd="tune.Type", dtype=TuneType),
-    tune_lag=dict(cmd="tune.Lag", dtype=float),
-    tune_stepY=dict(cmd="tune.Step Y", dtype=float),
+    PID_input=dict(cmd="pid.Input", dtype=str, ttl=5.0),
+    PID_mode=dict(cmd="pid.Mode", dtype=PIDMode, ttl=5.0),
+    P=dict(cmd="pid.P", dtype=float, ttl=5.0),
+    I=dict(cmd="pid.I", dtype=float, ttl=5.0),
+    D=dict(cmd="pid.D", dtype=float, ttl=5.0),
+    tune_mode=dict(cmd="tune.Mode", dtype=TuneMode, ttl=5.0),
+    tune_type=dict(cmd="tune.Type", dtype=TuneType, ttl=5.0),
+    tune_lag=dict(cmd="tune.Lag", dtype=float, ttl=5.0),
+    tune_stepY=dict(cmd="tune.Step Y", dtype=float, ttl=5.0),
 )
 
 INPUT_CHANNEL_ATTRIBUTES = dict(
     temperature=dict(cmd="Value", dtype=float, access=RO),
-    sensor_type=dict(cmd="Sensor", dtype=SensorType),
+    sensor_type=dict(cmd="Sensor", dtype=SensorType, ttl=5.0),
+)
+
+# channels the controller has, valid values of the channel properties
+OUTPUT_CHANNEL_NUMBERS = (1, 2)
+INPUT_CHANNEL_NUMBERS = (1, 2, 3, 4)
+
+OUTPUT_CHANNELS = [f"Out{n}" for n in OUTPUT_CHANNEL_NUMBERS]
+INPUT_CHANNELS = [f"In{n}" for n in INPUT_CHANNEL_NUMBERS]
+
+_CHANNEL_TABLES = (
+    (OUTPUT_CHANNELS, OUTPUT_CHANNEL_ATTRIBUTES),
+    (INPUT_CHANNELS, INPUT_CHANNEL_ATTRIBUTES),
 )
 
+# encoded requests of all channel attributes, shared by all device instances
+READ_CMD_BYTES = {
+    (channel, name): f"({channel}.{conf['cmd']}?)".encode("ascii") + _NL
+    for channels, attributes in _CHANNEL_TABLES
+    for channel in channels
+    for name, conf in attributes.items()
+}
+WRITE_PREFIX = {
+    (channel, name): f"({channel}.{conf['cmd']})=(".encode("ascii")
+    for channels, attributes in _CHANNEL_TABLES
+    for channel in channels
+    for name, conf in attributes.items()
+}
+
+_CHANNEL_ATTRS = {**OUTPUT_CHANNEL_ATTRIBUTES, **INPUT_CHANNEL_ATTRIBUTES}
+
+
+def _parser(dtype: type) -> Callable[[str], Any]:
+    if issubclass(dtype, IntEnum):
+        return lambda s: dtype[s]
+    return dtype
+
+
+def _formatter(dtype: type) -> Callable[[Any], bytes]:
+    if issubclass(dtype, IntEnum):
+        return {member: member.name.encode("ascii") for member in dtype}.__getitem__
+    return lambda v: str(v).encode("ascii")
+
+
+class ReplyTimeout(TimeoutError):
+    """The device did not answer a request in time."""
+
+
+def _echoes(reply: bytes, echo: bytes) -> bool:
+    # verbose replies echo the command: "<cmd> = <value>"
+    eq = reply.find(b"=")
+    return eq >= 0 and reply[:eq].strip().endswith(echo)
+
+
+PARSERS = {name: _parser(conf["dtype"]) for name, conf in _CHANNEL_ATTRS.items()}
+FORMATTERS = {name: _formatter(conf["dtype"]) for name, conf in _CHANNEL_ATTRS.items()}
+
 
 class CryovacTIC500(Device):
 
@@ -65,116 +137,506 @@ class CryovacTIC500(Device):
     port: int = device_property(default_value=23)
     input_channels: [int] = device_property(
         doc="List of input channels to use (1-4)",
-        default_value=[1, 2, 3, 4],
+        default_value=list(INPUT_CHANNEL_NUMBERS),
     )
     output_channels: [int] = device_property(
-        doc="List of output channels to use (1-2)", default_value=[1, 2]
+        doc="List of output channels to use (1-2)",
+        default_value=list(OUTPUT_CHANNEL_NUMBERS),
+    )
+    scan_period: float = device_property(
+        doc="Seconds between background reads of all channel attributes, "
+        "0 to query the device on every attribute read",
+        default_value=0.2,
     )
 
     output_on: bool = attribute(doc="Enable all outputs")
 
     def init_device(self) -> None:
         super().init_device()
-        self._channel_attrs = {}
-        self._channel_attrs.update(OUTPUT_CHANNEL_ATTRIBUTES)
-        self._channel_attrs.update(INPUT_CHANNEL_ATTRIBUTES)
+        self._cache: dict[int, tuple[float, Any]] = {}
+        self._scan_stop = threading.Event()
+        self._scanner = None
+        self._io_lock = threading.Lock()
+        self._reconnect_lock = threading.Lock()
+        self._generation = 0
+        self._next_reconnect = 0.0
+        self._offline = ""
+        self.conn = None
+        self._reader = None
+        self._alive = False
         try:
-            self.conn = socket.socket()
-            self.conn.connect((self.host, self.port))
-            self.conn.settimeout(0.5)
-            self.ensure_verbose_communication()
+            self._connect()
             self.set_state(DevState.ON)
         except Exception as exc:
+            self._go_offline(exc)
+            self.set_state(DevState.FAULT)
+            self.set_status(str(exc))
+        if hasattr(self, "_attr_index"):
+            # re-initialization, dynamic attributes already exist
+            self._start_scan()
+
+    def _connect(self) -> None:
+        conn = socket.socket()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Linux-only: declare the peer dead after ~20 s of silence
+        for opt, value in (
+            ("TCP_KEEPIDLE", 10),
+            ("TCP_KEEPINTVL", 3),
+            ("TCP_KEEPCNT", 3),
+        ):
+            if hasattr(socket, opt):
+                conn.setsockopt(socket.IPPROTO_TCP, getattr(socket, opt), value)
+        # the reader thread waits for replies with select(), the timeout only
+        # keeps connect() and sendall() from hanging on a dead peer
+        conn.settimeout(5)
+        try:
+            conn.connect((self.host, self.port))
+        except OSError:
+            conn.close()
+            raise
+        # (future, expected echo or None if any reply will do)
+        pending: deque[tuple[futures.Future, Optional[bytes]]] = deque()
+        with self._io_lock:
+            self.conn = conn
+            self._pending = pending
+            self._generation += 1
+            self._alive = True
+        # the reader only touches its own socket and queue, so a previous
+        # reader that is slow to exit cannot interfere with this connection
+        self._reader = threading.Thread(
+            target=self._reader_loop, args=(conn, pending), daemon=True
+        )
+        self._reader.start()
+        try:
+            self.ensure_verbose_communication()
+        except Exception:
+            self._disconnect()
+            raise
+
+    def _disconnect(self) -> None:
+        if self.conn is None:
+            return
+        try:
+            # wakes up the reader thread, which fails all pending requests and exits
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+        if self._reader is not None:
+            self._reader.join(timeout=1)
+
+    def _reconnect(self, generation: int) -> None:
+        with self._reconnect_lock:
+            if generation != self._generation:
+                # another thread has already reconnected
+                return
+            now = time.monotonic()
+            if now < self._next_reconnect:
+                raise ConnectionError(
+                    f"{self._offline} (next reconnect attempt in "
+                    f"{self._next_reconnect - now:.1f} s)"
+                )
+            # only the first attempt after losing the device is worth a warning
+            log = self.debug_stream if self._offline else self.warn_stream
+            log("Reconnecting to device")
+            self._disconnect()
+            try:
+                self._connect()
+            except (OSError, RuntimeError) as exc:
+                # RuntimeError: the device rejected the verbose check
+                self._go_offline(exc)
+                raise ConnectionError(f"Reconnect failed: {exc}") from exc
+            self._offline = ""
+            self._next_reconnect = 0.0
+            self.set_state(DevState.ON)
+            self.set_status("Reconnected to device")
+
+    def _go_offline(self, exc: Exception) -> None:
+        # remember why, and hold off reconnecting for a while
+        self._offline = str(exc) or type(exc).__name__
+        self._next_reconnect = time.monotonic() + RECONNECT_INTERVAL
+
+    def _retry(self, func: Callable, *args):
+        # on communication errors, reconnect and try once more
+        generation = self._generation
+        try:
+            return func(*args)
+        except ReplyTimeout:
+            # the connection is fine, the device just did not answer
+            raise
+        except OSError as exc:
+            log = self.debug_stream if self._offline else self.warn_stream
+            log(f"Communication failed: {exc}")
+        try:
+            self._reconnect(generation)
+            return func(*args)
+        except ReplyTimeout:
+            raise
+        except OSError as exc:
             self.set_state(DevState.FAULT)
             self.set_status(str(exc))
+            raise
 
     @output_on.read
     def read_output_on(self) -> bool:
-        ans = self.query("outputEnable?")
-        return "OutputEnable = On" in ans
+        ans = self._transact(b"outputEnable?" + _NL, OUTPUT_ENABLE)
+        return b"OutputEnable = On" in ans
 
     @output_on.write
     def write_output_on(self, value: bool) -> None:
-        val = "on" if value else "off"
-        ans = self.query(f"outputEnable = {val}")
+        val = b"on" if value else b"off"
+        ans = self._transact(b"outputEnable = " + val + _NL, OUTPUT_ENABLE)
 
     @command
     def query(self, cmd: str) -> str:
-        self.conn.send(f"{cmd}\n".encode())
-        ans = self.conn.recv(1024).decode().strip()
-        self.debug_stream(f"query({cmd}) -> {ans}")
-        if ans.startswith("Error"):
-            self.error_stream(ans)
-            raise RuntimeError(ans)
+        return self._transact(cmd.encode("ascii") + _NL).decode()
+
+    def _transact(self, request: bytes, echo: Optional[bytes] = None) -> bytes:
+        return self._retry(self._roundtrip, request, echo)
+
+    def _roundtrip(self, request: bytes, echo: Optional[bytes] = None) -> bytes:
+        (fut,) = self._submit([request], [echo])
+        ans = self._wait(fut)
+        self.debug_stream(f"query({request!r}) -> {ans!r}")
+        if ans.startswith(b"Error"):
+            self.error_stream(ans.decode())
+            raise RuntimeError(ans.decode())
         return ans
 
+    def _submit(
+        self, requests: list[bytes], echoes: list[Optional[bytes]]
+    ) -> list[futures.Future]:
+        # queue the futures before sending, so a reply cannot overtake them;
+        # the lock only keeps queue order and send order in sync, callers
+        # wait for their replies outside of it (pipelining)
+        futs = [futures.Future() for _ in requests]
+        with self._io_lock:
+            if not self._alive:
+                raise ConnectionError("Not connected to device")
+            self._pending.extend(zip(futs, echoes))
+            try:
+                self.conn.sendall(b"".join(requests))
+            except OSError:
+                # nothing was answered yet, drop the futures so they do not
+                # steal replies of later requests
+                for _ in futs:
+                    self._pending.pop()
+                raise
+        return futs
+
+    def _wait(self, fut: futures.Future) -> bytes:
+        try:
+            return fut.result(timeout=REPLY_TIMEOUT)
+        except futures.TimeoutError:
+            pass
+        if not self._unqueue([fut]):
+            # the reply arrived just now
+            return fut.result()
+        raise ReplyTimeout("Timeout. Did you expect a reply?")
+
+    def _unqueue(self, futs: list[futures.Future]) -> set[futures.Future]:
+        # unqueue unanswered futures, so they cannot take the replies to later
+        # requests; a reply that does arrive late is discarded if the oldest
+        # pending request expects a different echo, but taken by a request
+        # that accepts any reply (query)
+        with self._io_lock:
+            late = {fut for fut in futs if not fut.done()}
+            if late:
+                kept = [entry for entry in self._pending if entry[0] not in late]
+                self._pending.clear()
+                self._pending.extend(kept)
+        return late
+
+    def _reader_loop(self, conn: socket.socket, pending: deque) -> None:
+        # replies arrive in request order, hand each one to the oldest waiter;
+        # the select() timeout backs off while idle, so the loop stays cheap
+        # but still notices a closed socket
+        rxbuf = bytearray()
+        chunk = memoryview(bytearray(RECV_SIZE))
+        wait = POLL_MIN
+        while True:
+            try:
+                readable, _, _ = select.select([conn], [], [], wait)
+                if not readable:
+                    wait = min(wait * 2, POLL_MAX)
+                    continue
+                wait = POLL_MIN
+                lines = self._recv_lines(conn, rxbuf, chunk)
+            except Exception as exc:
+                with self._io_lock:
+                    if self.conn is conn:
+                        self._alive = False
+                    while pending:
+                        pending.popleft()[0].set_exception(
+                            ConnectionError(f"Connection lost: {exc}")
+                        )
+                return
+            with self._io_lock:
+                for line in lines:
+                    self._dispatch(pending, line)
+
+    def _dispatch(self, pending: deque, line: bytes) -> None:
+        # called with _io_lock held; error messages carry no echo and always
+        # answer the oldest request. Replies arrive in request order, so one
+        # that echoes a later request means the replies to the requests before
+        # it got lost; a reply that echoes none answers something nobody waits
+        # for (send_command). Requests that take any reply end the search.
+        if pending:
+            fut, echo = pending[0]
+            if echo is None or line.startswith(b"Error"):
+                pending.popleft()
+                fut.set_result(line)
+                return
+            for k, (fut, echo) in enumerate(pending):
+                if echo is None:
+                    break
+                if _echoes(line, echo):
+                    for _ in range(k):
+                        pending.popleft()[0].set_exception(
+                            ReplyTimeout(
+                                "Reply lost, the device answered later requests"
+                            )
+                        )
+                    pending.popleft()
+                    fut.set_result(line)
+                    return
+        self.debug_stream(f"Discarding unsolicited reply: {line}")
+
+    def _recv_lines(
+        self, conn: socket.socket, rxbuf: bytearray, chunk: memoryview
+    ) -> list[bytes]:
+        # receive into a preallocated chunk and consume the buffer in place
+        n = conn.recv_into(chunk)
+        if not n:
+            raise ConnectionError("Connection closed by device")
+        self._quickack(conn)
+        lines = []
+        start = len(rxbuf)
+        rxbuf += chunk[:n]
+        end = rxbuf.find(_NL, start)
+        while end >= 0:
+            lines.append(bytes(rxbuf[:end]).strip())
+            del rxbuf[: end + 1]
+            end = rxbuf.find(_NL)
+        return lines
+
+    @staticmethod
+    def _quickack(conn: socket.socket) -> None:
+        # TCP_QUICKACK is Linux-only and reset by the kernel, re-arm after each recv
+        try:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        except (AttributeError, OSError):
+            pass
+
     @command
     def send_command(self, cmd: str) -> None:
-        self.conn.send(f"{cmd}\n".encode())
+        # never waits for a reply; if the controller sends one anyway, the
+        # reader thread discards it unless the oldest pending request echoes
+        # the same command, or is a query() or the verbose check, which take
+        # any reply: then that reply is lost and the next ones are shifted
+        self._retry(self._send, cmd.encode("ascii") + _NL)
+
+    def _send(self, request: bytes) -> None:
+        with self._io_lock:
+            if not self._alive:
+                raise ConnectionError("Not connected to device")
+            self.conn.sendall(request)
 
     @command
     def get_description(self) -> str:
         return self.query("description")
 
     def delete_device(self) -> None:
-        self.conn.close()
+        self._scan_stop.set()
+        if self._scanner is not None:
+            # a scan in flight ends within its batch deadline; do not let a
+            # hanging reconnect block Init, the thread stops on its own later
+            self._scanner.join(timeout=2 * REPLY_TIMEOUT)
+        self._disconnect()
 
     def initialize_dynamic_attributes(self):
-        for n in self.output_channels:
+        # per-attribute data as parallel lists, indexed via _attr_index
+        self._attr_index: dict[str, int] = {}
+        self._echo: list[bytes] = []
+        self._read_bytes: list[bytes] = []
+        self._write_prefix: list[bytes] = []
+        self._parse: list[Callable[[str], Any]] = []
+        self._format: list[Callable[[Any], bytes]] = []
+        self._ttl: list[float] = []
+        outputs = self._channels("output", self.output_channels, OUTPUT_CHANNEL_NUMBERS)
+        inputs = self._channels("input", self.input_channels, INPUT_CHANNEL_NUMBERS)
+        for n in outputs:
             for name, conf in OUTPUT_CHANNEL_ATTRIBUTES.items():
-                access = conf.get("access", RW)
-                fset = self.generic_write if access == RW else None
-                attr = attribute(
-                    name=f"Out{n}.{name}",
-                    dtype=conf["dtype"],
-                    fget=self.generic_read,
-                    fset=fset,
-                )
-                self.add_attribute(attr)
-        for n in self.input_channels:
+                self._add_channel_attribute(f"Out{n}", name, conf)
+        for n in inputs:
             for name, conf in INPUT_CHANNEL_ATTRIBUTES.items():
-                access = conf.get("access", RW)
-                fset = self.generic_write if access == RW else None
-                attr = attribute(
-                    name=f"In{n}.{name}",
-                    dtype=conf["dtype"],
-                    fget=self.generic_read,
-                    fset=fset,
-                )
-                self.add_attribute(attr)
+                self._add_channel_attribute(f"In{n}", name, conf)
+        self._start_scan()
+
+    @staticmethod
+    def _channels(kind: str, numbers, valid: tuple[int, ...]) -> list[int]:
+        invalid = [n for n in numbers if n not in valid]
+        if invalid:
+            raise ValueError(
+                f"Invalid {kind}_channels {invalid}, the controller has "
+                f"{kind} channels {list(valid)}"
+            )
+        return list(numbers)
+
+    def _add_channel_attribute(self, channel: str, name: str, conf: dict) -> None:
+        access = conf.get("access", RW)
+        fset = self.generic_write if access == RW else None
+        attr = attribute(
+            name=f"{channel}.{name}",
+            dtype=conf["dtype"],
+            fget=self.generic_read,
+            fset=fset,
+        )
+        self.add_attribute(attr)
+        # everything generic_read/generic_write need, from the shared tables
+        self._attr_index[f"{channel}.{name}"] = len(self._echo)
+        self._echo.append(f"{channel}.{conf['cmd']}".encode("ascii"))
+        self._read_bytes.append(READ_CMD_BYTES[channel, name])
+        self._write_prefix.append(WRITE_PREFIX[channel, name])
+        self._parse.append(PARSERS[name])
+        self._format.append(FORMATTERS[name])
+        self._ttl.append(conf.get("ttl", 0))
 
     def ensure_verbose_communication(self):
-        ans = self.query("system.com.verbose?")
-        if not "High" in ans:
+        # runs while (re)connecting, so bypass the reconnecting query/send_command
+        ans = self._roundtrip(b"system.com.verbose?" + _NL)
+        if not b"High" in ans:
             self.info_stream("Setting device communication to verbose.")
-            self.send_command(f"system.com.verbose=high")
+            self._send(VERBOSE_ON + _NL)
         else:
             self.info_stream("Device communication is verbose.")
 
-    def generic_read(self, attr: attribute):
-        channel, variable = attr.get_name().split(".")
-        cmd = self._channel_attrs[variable]["cmd"]
-        dtype = self._channel_attrs[variable]["dtype"]
-        ans = self.query(f"({channel}.{cmd}?)")
+    def _start_scan(self) -> None:
+        if self.scan_period > 0:
+            # pass the event, init_device replaces it for the next scan thread
+            self._scanner = threading.Thread(
+                target=self._scan_loop, args=(self._scan_stop,), daemon=True
+            )
+            self._scanner.start()
+
+    def _scan_loop(self, stop: threading.Event) -> None:
+        # one pipelined batch per period refreshes every value older than its
+        # ttl; Tango attribute reads are then served from the cache
+        while not stop.wait(self.scan_period):
+            try:
+                self._scan_once()
+            except OSError as exc:
+                # device unreachable, _retry has already reported it
+                self.debug_stream(f"Scan failed: {exc}")
+            except Exception as exc:
+                # keep scanning, a dead scan thread would leave all values stale
+                self.error_stream(f"Scan failed: {exc!r}")
+
+    def _scan_once(self) -> None:
+        # generic_write may pop cache entries at any time, read them with get()
+        now = time.monotonic()
+        indices = []
+        for i, ttl in enumerate(self._ttl):
+            entry = self._cache.get(i)
+            if entry is None or now - entry[0] >= ttl:
+                indices.append(i)
+        if not indices:
+            return
+        started = time.monotonic()
+        values = self._retry(self._read_batch, indices)
+        ts = time.monotonic()
+        for i, value in values.items():
+            entry = self._cache.get(i)
+            if entry is not None and entry[0] > started:
+                # written while the batch was in flight, keep the newer value
+                continue
+            self._cache[i] = (ts, value)
 
-        cmd_ret, ans = [s.strip() for s in ans.split("=")]
+    def _flush_batch(
+        self, requests: list[bytes], echoes: list[Optional[bytes]]
+    ) -> list[Optional[bytes]]:
+        # one deadline for the whole batch; requests that got no reply by then
+        # are unqueued, they and those whose reply got lost get None
+        futs = self._submit(requests, echoes)
+        futures.wait(futs, timeout=REPLY_TIMEOUT)
+        late = self._unqueue(futs)
+        replies = []
+        for fut in futs:
+            if fut in late:
+                replies.append(None)
+                continue
+            # on a lost connection every future fails and _retry reconnects
+            try:
+                replies.append(fut.result())
+            except ReplyTimeout:
+                replies.append(None)
+        self.debug_stream(f"batch({len(requests)}) -> {replies}")
+        return replies
+
+    @staticmethod
+    def _reply_value(raw: bytes) -> str:
+        # the reader thread only hands over replies that echo the command:
+        # "<channel>.<cmd> = <value>"
+        return raw[raw.find(b"=") + 1 :].strip().decode()
+
+    def _parse_reply(self, i: int, raw: bytes):
+        ans = self._reply_value(raw)
         self.debug_stream(f"generic_read -> {ans}")
-        if not cmd_ret.endswith(cmd):
-            self.warn_stream(f"Reply does not match command: {cmd} -> {cmd_ret}")
+        return self._parse[i](ans)
 
-        if issubclass(dtype, IntEnum):
-            return dtype[ans]
-        else:
-            return dtype(ans)
+    def _read_one(self, i: int):
+        return self._parse_reply(i, self._roundtrip(self._read_bytes[i], self._echo[i]))
+
+    def _read_batch(self, indices: list[int]) -> dict[int, Any]:
+        replies = self._flush_batch(
+            [self._read_bytes[i] for i in indices], [self._echo[i] for i in indices]
+        )
+        values = {}
+        for i, raw in zip(indices, replies):
+            if raw is None:
+                self.debug_stream(f"No reply to {self._read_bytes[i]!r}")
+                continue
+            if raw.startswith(b"Error"):
+                self.error_stream(raw.decode())
+                continue
+            try:
+                values[i] = self._parse_reply(i, raw)
+            except (KeyError, ValueError) as exc:
+                self.warn_stream(f"Cannot parse reply {raw!r}: {exc}")
+        return values
+
+    def generic_read(self, attr: attribute):
+        i = self._attr_index[attr.get_name()]
+        now = time.monotonic()
+        entry = self._cache.get(i)
+        if entry is not None:
+            ts, value = entry
+            age = now - ts
+            if self._scanner is not None:
+                if age < self._ttl[i] + STALE_SCANS * self.scan_period:
+                    quality = AttrQuality.ATTR_VALID
+                else:
+                    quality = AttrQuality.ATTR_INVALID
+                return value, time.time() - age, quality
+            if age < self._ttl[i]:
+                return value
+        # not scanned yet, or scanning disabled
+        value = self._retry(self._read_one, i)
+        self._cache[i] = (now, value)
+        return value
 
     def generic_write(self, attr: attribute) -> None:
-        channel, variable = attr.get_name().split(".")
-        value = attr.get_write_value()
-        cmd = self._channel_attrs[variable]["cmd"]
-        dtype = self._channel_attrs[variable]["dtype"]
-        if issubclass(dtype, IntEnum):
-            value = dtype(value).name
-        ans = self.query(f"({channel}.{cmd})=({value})")
-        cmd_ret, ans = [s.strip() for s in ans.split("=")]
-        if cmd != cmd_ret:
-            self.warn_stream(f"reply does not match command: {cmd} -> {cmd_ret}")
+        i = self._attr_index[attr.get_name()]
+        self._retry(self._write_one, i, self._format[i](attr.get_write_value()))
+
+    def _write_one(self, i: int, value: bytes) -> None:
+        raw = self._roundtrip(
+            self._write_prefix[i] + value + _WRITE_SUFFIX, self._echo[i]
+        )
+        ans = self._reply_value(raw)
+        try:
+            # the reply echoes the new value
+            self._cache[i] = (time.monotonic(), self._parse[i](ans))
+        except (KeyError, ValueError):
+            self._cache.pop(i, None)